@@ -139,6 +139,7 @@ def test_names_run_ids_and_basecallers(prepare):
             ingress_results_dir / meta["alias"] / res_seqs_fname,
             output_type,
             output_type,
+            collect_names=True,
         )
 
         # now collect the entries from the individual input files
@@ -157,7 +158,9 @@ def test_names_run_ids_and_basecallers(prepare):
                 and util.is_unaligned(file)
             ):
                 continue
-            curr_entries = util.create_preliminary_meta(file, input_type, output_type)
+            curr_entries = util.create_preliminary_meta(
+                file, input_type, output_type, collect_names=True
+            )
             exp_read_names += curr_entries["names"]
             exp_run_ids += curr_entries["run_ids"]
             exp_basecallers += curr_entries["basecall_models"]
@@ -1,16 +1,45 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from itertools import chain, repeat
+import os
 from pathlib import Path
 import re
+import struct
 
-import pandas as pd
-import pysam
-
+# NB: `pysam` is imported in the functions that need it to keep importing this module
+# (e.g. for `INPUT_TYPES_EXTENSIONS` or `create_metadict()`) cheap
 
 INPUT_TYPES_EXTENSIONS = {
-    "fastq": ["fastq", "fastq.gz", "fq", "fq.gz"],
-    "bam": ["bam", "ubam"],
+    "fastq": ("fastq", "fastq.gz", "fq", "fq.gz"),
+    "bam": ("bam", "ubam"),
 }
 
+# patterns for extracting tags from FASTQ header comments (only used as a fallback by
+# `get_comment_tag()`)
+RUNID_RE = re.compile(r"runid=([^\s]+)")
+BASECALL_MODEL_RE = re.compile(r"basecall_model_version_id=([^\s]+)")
+RDZ_RE = re.compile(r"RD:Z:([^\s]+)")
+# patterns for extracting the run ID and basecall model from `RG.DS` in XAM headers
+DS_RUNID_RE = re.compile(r"(?:^|\s)runid=(\S+)")
+DS_BASECALL_MODEL_RE = re.compile(r"(?:^|\s)basecall_model=(\S+)")
+
+# number of CPUs this process may run on (`os.cpu_count()` reports all cores of the
+# host, even if we are restricted to a subset of them)
+AVAILABLE_CPUS = (
+    len(os.sched_getaffinity(0))
+    if hasattr(os, "sched_getaffinity")
+    else os.cpu_count() or 1
+)
+# number of threads used by htslib (mostly for BGZF decompression) when iterating over
+# the records of a XAM file in the main process; files scanned in the worker processes
+# of `get_scan_executor()` are read single-threaded
+XAM_THREADS = max(2, AVAILABLE_CPUS // 4)
+# process pool (and its number of workers) shared by all calls of
+# `create_preliminary_meta()`; see `get_scan_executor()`
+scan_executor = None
+scan_executor_workers = 0
+
 
 def validate_xam_index(xam_file):
     """Use fetch to validate the index.
@@ -18,6 +47,8 @@ def validate_xam_index(xam_file):
     Invalid indexes will fail the call with a ValueError:
     ValueError: fetch called on bamfile without index
     """
+    import pysam
+
     with pysam.AlignmentFile(xam_file, check_sq=False) as alignments:
         try:
             alignments.fetch()
@@ -35,19 +66,316 @@ def check_input_type(input_type):
 
 
 def is_target_file(file, input_type):
-    """Check if `file` is of `input_type`."""
-    if not file.is_file():
-        return False
-    exts = INPUT_TYPES_EXTENSIONS[input_type]
-    return any(map(lambda ext: file.name.endswith(ext), exts))
+    """Check if `file` (a `Path` or `os.DirEntry`) is of `input_type`."""
+    return file.name.endswith(INPUT_TYPES_EXTENSIONS[input_type]) and file.is_file()
 
 
 def get_target_files(path, input_type):
-    """Return a list of target files in the directory."""
-    return list(filter(lambda file: is_target_file(file, input_type), path.iterdir()))
+    """Return a list of target files in the directory.
+
+    Uses `os.scandir()` so that the file type usually comes from the directory entry
+    itself rather than requiring an extra `stat` call per file.
+    """
+    with os.scandir(path) as entries:
+        return [
+            Path(entry.path)
+            for entry in entries
+            if is_target_file(entry, input_type)
+        ]
+
+
+def get_sq_lines(header):
+    """Extract the relevant fields of the `@SQ` lines from a XAM header."""
+    return [{
+        "SN": sq["SN"],
+        "LN": sq["LN"],
+        "M5": sq.get("M5"),
+    } for sq in header.get("SQ", [])]
+
+
+def read_sq_lines(xam_file):
+    """Get the relevant fields of the `@SQ` lines of a BAM file.
+
+    Only the start of the file is decompressed to read the raw header text, which is
+    much cheaper than opening it with `pysam.AlignmentFile`. We fall back to the
+    latter if the file doesn't look like a BAM, the header can't be parsed (e.g. it is
+    truncated or not valid UTF-8), or the `@SQ` lines in the header text don't match
+    the number of references.
+    """
+    import pysam
+    from pysam.libcbgzf import BGZFile
+
+    with BGZFile(str(xam_file), "rb") as f:
+        if f.read(4) == b"BAM\1":
+            try:
+                (l_text,) = struct.unpack("<i", f.read(4))
+                # the header text may be NUL-padded / terminated
+                header_text = f.read(l_text).decode().rstrip("\0")
+                (n_ref,) = struct.unpack("<i", f.read(4))
+                sq_lines = []
+                for line in header_text.splitlines():
+                    if not line.startswith("@SQ\t"):
+                        continue
+                    fields = dict(
+                        field.split(":", 1) for field in line.split("\t")[1:]
+                    )
+                    sq_lines.append({
+                        "SN": fields["SN"],
+                        "LN": int(fields["LN"]),
+                        "M5": fields.get("M5"),
+                    })
+            except (struct.error, KeyError, ValueError):
+                # `ValueError` includes `UnicodeDecodeError`; let `pysam` deal with
+                # anything we can't parse
+                sq_lines = None
+            if sq_lines is not None and len(sq_lines) == n_ref:
+                return sq_lines
+    with pysam.AlignmentFile(xam_file, check_sq=False) as f:
+        return get_sq_lines(f.header)
+
+
+def get_comment_tag(comment, tag, pattern, previous=None):
+    """Get the value of `tag` (e.g. `runid=`) from a FASTQ header comment.
+
+    Returns `None` if the tag is not present and blows up if it is present more than
+    once. The common case of a single tag in a space-delimited comment is handled with
+    plain string operations; anything else falls back to `pattern`, which only
+    succeeds if there is exactly one match. If `previous` is
+    provided (i.e. the value found in the previous record), we first check whether the
+    comment contains the same value, as all reads in a file usually share it.
+    """
+    if previous is not None:
+        tag_value = tag + previous
+        start = comment.find(tag_value)
+        # only take the shortcut if this is the sole occurrence of `tag`
+        if start >= 0 and comment.find(tag) == start:
+            end = start + len(tag_value)
+            if end == len(comment) or (
+                comment[end] in " \t" and comment.find(tag, end) < 0
+            ):
+                return previous
+    start = comment.find(tag)
+    if start < 0:
+        return None
+    start += len(tag)
+    end = comment.find(" ", start)
+    value = comment[start:end if end >= 0 else None]
+    if value and "\t" not in value and (end < 0 or comment.find(tag, end) < 0):
+        return value
+    (value,) = pattern.findall(comment)
+    return value
+
+
+def scan_fastq(file, collect_names=False):
+    """Count reads and collect run IDs and basecall models from a FASTQ file.
+
+    Kept separate from `create_preliminary_meta()` so that the per-record loop only
+    touches local names. Read names are only collected if `collect_names` is `True`.
+    """
+    import pysam
+
+    n_seqs = 0
+    names = []
+    names_append = names.append
+    run_ids = set()
+    basecall_models = set()
+    # values of the previous record; used to skip parsing and set updates for
+    # subsequent reads with the same values
+    prev_run_id = None
+    prev_basecall_model = None
+    with pysam.FastxFile(str(file), persist=False) as f:
+        for entry in f:
+            n_seqs += 1
+            if collect_names:
+                names_append(entry.name)
+            # only look for things in the FASTQ header comment if there is one
+            comment = entry.comment
+            if comment is None:
+                continue
+            # check for "regular" tags first
+            run_id = get_comment_tag(comment, "runid=", RUNID_RE, prev_run_id)
+            basecall_model = get_comment_tag(
+                comment,
+                "basecall_model_version_id=",
+                BASECALL_MODEL_RE,
+                prev_basecall_model,
+            )
+            # now check for SAM tags (which could come from running `samtools
+            # fastq` on dorado output)
+            if "RD:Z:" in comment:
+                # explode if we already found a run ID
+                if run_id is not None:
+                    raise ValueError(
+                        "Found 'runid=' and 'RD:Z:' in "
+                        f"FASTQ header '{comment}'."
+                    )
+                run_id = get_comment_tag(comment, "RD:Z:", RDZ_RE, prev_run_id)
+            if "RG:Z:" in comment:
+                if basecall_model is not None:
+                    raise ValueError(
+                        "Found 'basecall_model_version_id=' and 'RG:Z:' in "
+                        f"FASTQ header '{comment}'."
+                    )
+                rg = comment.split("RG:Z:")[1].split()[0]
+                basecall_model = rg.split("_barcode")[0].split("_", 1)[1]
+            if run_id is not None and run_id != prev_run_id:
+                run_ids.add(run_id)
+                prev_run_id = run_id
+            if basecall_model is not None and basecall_model != prev_basecall_model:
+                basecall_models.add(basecall_model)
+                prev_basecall_model = basecall_model
+    return n_seqs, names, run_ids, basecall_models
+
+
+def scan_xam_records(alignments, collect_names=False):
+    """Count reads and collect run IDs and primary / unmapped counts from an open XAM.
+
+    Read names are only collected if `collect_names` is `True`.
+    """
+    n_seqs = 0
+    names = []
+    names_append = names.append
+    run_ids = set()
+    n_primary = 0
+    n_unmapped = 0
+    # stream the records sequentially; we only look at the flag, name and `RD` tag so
+    # there is no need for the index or any region logic
+    for entry in alignments.fetch(until_eof=True):
+        n_seqs += 1
+        # Just take unmapped reads and primary alignments; test the flag bits directly
+        # (4: unmapped, 256: secondary, 2048: supplementary)
+        flag = entry.flag
+        if flag & 4:
+            n_unmapped += 1
+        elif not flag & (256 | 2048):
+            n_primary += 1
+        if collect_names:
+            names_append(entry.query_name)
+        if entry.has_tag("RD"):
+            run_ids.add(entry.get_tag("RD", with_value_type=False))
+    return n_seqs, names, run_ids, n_primary, n_unmapped
+
+
+def get_flagstat_counts(xam_file, threads=1):
+    """Get the number of records, primary alignments and unmapped reads of a XAM file.
+
+    This uses `samtools flagstat` (via `pysam`) and gives the same counts as
+    `scan_xam_records()` without looking at the individual records in Python.
+    """
+    import pysam
+
+    thread_args = ["-@", str(threads)] if threads > 1 else []
+    flagstat = {}
+    for line in pysam.flagstat(*thread_args, "-O", "tsv", str(xam_file)).splitlines():
+        qc_passed, qc_failed, category = line.split("\t")
+        flagstat[category] = (qc_passed, qc_failed)
+
+    def get_count(category):
+        return sum(map(int, flagstat[category]))
+
+    n_seqs = get_count("total (QC-passed reads + QC-failed reads)")
+    return n_seqs, get_count("primary mapped"), n_seqs - get_count("mapped")
+
 
+def scan_xam(file, collect_names=False, threads=1):
+    """Collect header information, read counts and run IDs from a XAM file."""
+    import pysam
 
-def create_preliminary_meta(path, input_type, output_type):
+    run_ids = set()
+    basecall_models = set()
+    with pysam.AlignmentFile(file, check_sq=False, threads=threads) as f:
+        sq_lines = get_sq_lines(f.header)
+        xam_sorted = f.header.get('HD', {}).get('SO') == 'coordinate'
+        # map (run_id, basecall_model) pairs to RG.IDs in order
+        # to determine if RGs have had collision avoidance applied
+        runid_model_to_rgid = defaultdict(set)
+        read_groups = f.header.get("RG", [])
+        # whether every read group has a run ID in its DS (in which case these are the
+        # run IDs of the file and the `RD` tags of the records are not needed)
+        all_rgs_have_runid = bool(read_groups)
+        # populate metamap items from RG.DS
+        for read_group in read_groups:
+            rg_id = read_group.get("ID")
+            ds = read_group.get("DS", "")
+            rg_runids = DS_RUNID_RE.findall(ds)
+            rg_basecall_models = DS_BASECALL_MODEL_RE.findall(ds)
+            run_ids.update(rg_runids)
+            basecall_models.update(rg_basecall_models)
+            if not rg_runids:
+                all_rgs_have_runid = False
+            if rg_id and rg_runids and rg_basecall_models:
+                compound_key = f"{rg_runids[-1]}/{rg_basecall_models[-1]}"
+                runid_model_to_rgid[compound_key].add(rg_id)
+        if all_rgs_have_runid and not collect_names:
+            # the run IDs are in the header and we don't need the read names; let
+            # `samtools flagstat` do the counting instead of iterating in Python
+            names = []
+            n_seqs, n_primary, n_unmapped = get_flagstat_counts(file, threads)
+        else:
+            n_seqs, names, record_run_ids, n_primary, n_unmapped = scan_xam_records(
+                f, collect_names
+            )
+            # ignore the `RD` tags if the header has all run IDs so that the result
+            # doesn't depend on `collect_names`
+            if not all_rgs_have_runid:
+                run_ids.update(record_run_ids)
+        # looks like RG.IDs have collided without merging (CW-4608)
+        if any(len(rgids) > 1 for rgids in runid_model_to_rgid.values()):
+            raise ValueError(
+                "BAM appears to have multiple RG.IDs corresponding to "
+                "the same sequencing run in the same file. Suspect that "
+                "this BAM was created with samtools merge without -c."
+            )
+    return dict(
+        n_seqs=n_seqs,
+        names=names,
+        run_ids=run_ids,
+        basecall_models=basecall_models,
+        n_primary=n_primary,
+        n_unmapped=n_unmapped,
+        sq_lines=sq_lines,
+        xam_sorted=xam_sorted,
+    )
+
+
+def scan_file(file, input_type, collect_names=False, threads=1):
+    """Scan a single target file for `create_preliminary_meta()`.
+
+    This needs to be a top-level function so that it can be run in a worker process.
+    `threads` is only used for XAM files.
+    """
+    if input_type == "fastq":
+        n_seqs, names, run_ids, basecall_models = scan_fastq(file, collect_names)
+        return dict(
+            n_seqs=n_seqs,
+            names=names,
+            run_ids=run_ids,
+            basecall_models=basecall_models,
+        )
+    return scan_xam(file, collect_names, threads)
+
+
+def get_scan_executor(n_workers):
+    """Get a process pool with at least `n_workers` workers for scanning files.
+
+    The pool is shared between calls of `create_preliminary_meta()` so that the worker
+    processes are only started once rather than for every input directory. It is only
+    replaced (by a larger one) when more workers are requested, so it never has more
+    workers than the largest number of files scanned at once. It is shut down on
+    interpreter exit.
+    """
+    global scan_executor, scan_executor_workers
+    if scan_executor is None or scan_executor_workers < n_workers:
+        if scan_executor is not None:
+            scan_executor.shutdown()
+        scan_executor = ProcessPoolExecutor(max_workers=n_workers)
+        scan_executor_workers = n_workers
+    return scan_executor
+
+
+def create_preliminary_meta(
+    path, input_type, output_type, sq_cache=None, collect_names=False
+):
     """Create a dict of sequence IDs / names and run_ids.
 
     :param path: can be a single target file, a list of target files, or a directory
@@ -55,12 +383,18 @@ def create_preliminary_meta(path, input_type, output_type):
     :param input_type: can either be "fastq" or "bam"
     :param output_type: either "fastq" or "bam"; is "fastq" when `xam_ingress` was run
         with `--return_fastq`
+    :param sq_cache: optional dict; if provided, the `@SQ` lines of each XAM file are
+        stored in it (keyed by absolute path) so that `is_unaligned()` does not need to
+        parse the headers again
+    :param collect_names: whether to also return the read names under `names`;
+        otherwise only the number of reads is kept to avoid holding all names in
+        memory
 
     For FASTQ files, the run IDs can be present in the header lines in the format
     `runid=...` or `RD:Z:...`. If both are present, an error is thrown.
     """
     check_input_type(input_type)
-    names = []
+    n_seqs = 0
     run_ids = set()
     if isinstance(path, list):
         target_files = path
@@ -84,98 +418,50 @@ def create_preliminary_meta(path, input_type, output_type):
         if Path(src_xam + '.bai').exists() and validate_xam_index(src_xam):
             src_xai = src_xam + '.bai'
     basecall_models = set()
-    for file in target_files:
-        if input_type == "fastq":
-            with pysam.FastxFile(file) as f:
-                for entry in f:
-                    names.append(entry.name)
-                    run_id = None
-                    basecall_model = None
-                    # only look for things in the FASTQ header comment if there is one
-                    if entry.comment is None:
-                        continue
-                    # check for "regular" tags first
-                    if "runid=" in entry.comment:
-                        (run_id,) = re.findall(r"runid=([^\s]+)", entry.comment)
-                    if "basecall_model_version_id=" in entry.comment:
-                        (basecall_model,) = re.findall(
-                            r"basecall_model_version_id=([^\s]+)", entry.comment
-                        )
-                    # now check for SAM tags (which could come from running `samtools
-                    # fastq` on dorado output)
-                    if "RD:Z:" in entry.comment:
-                        # explode if we already found a run ID
-                        if run_id is not None:
-                            raise ValueError(
-                                "Found 'runid=' and 'RD:Z:' in "
-                                f"FASTQ header '{entry.comment}'."
-                            )
-                        (run_id,) = re.findall(r"RD:Z:([^\s]+)", entry.comment)
-                    if "RG:Z:" in entry.comment:
-                        if basecall_model is not None:
-                            raise ValueError(
-                                "Found 'basecall_model_version_id=' and 'RG:Z:' in "
-                                f"FASTQ header '{entry.comment}'."
-                            )
-                        rg = entry.comment.split("RG:Z:")[1].split()[0]
-                        basecall_model = rg.split("_barcode")[0].split("_", 1)[1]
-                    if run_id is not None:
-                        run_ids.add(run_id)
-                    if basecall_model is not None:
-                        basecall_models.add(basecall_model)
-        else:
-            unaligned = is_unaligned(file)
-            with pysam.AlignmentFile(file, check_sq=False) as f:
-                xam_sorted = f.header.get('HD', {}).get('SO') == 'coordinate'
-                # Check if the data are aligned
-                if not unaligned and not xam_sorted:
-                    src_xam = None
-                    src_xai = None
-                # map (run_id, basecall_model) pairs to RG.IDs in order
-                # to determine if RGs have had collision avoidance applied
-                runid_model_to_rgid = defaultdict(set)
-                # populate metamap items from RG.DS
-                for read_group in f.header.get("RG", []):
-                    rg_id = read_group.get("ID")
-                    rg_runid = None
-                    rg_basecall_model = None
-                    for ds_kv in read_group.get("DS", "").split():
-                        k, v = ds_kv.split("=", 1)
-                        if k == "runid":
-                            rg_runid = v
-                            run_ids.add(rg_runid)
-                        elif k == "basecall_model":
-                            rg_basecall_model = v
-                            basecall_models.add(rg_basecall_model)
-                    if rg_id and rg_runid and rg_basecall_model:
-                        compound_key = f"{rg_runid}/{rg_basecall_model}"
-                        runid_model_to_rgid[compound_key].add(rg_id)
-                for entry in f:
-                    # Just take unmapped reads and primary alignments
-                    if entry.is_unmapped:
-                        n_unmapped += 1
-                    else:
-                        if not (entry.is_secondary or entry.is_supplementary):
-                            n_primary += 1
-                    run_id = dict(entry.tags).get("RD")
-                    names.append(entry.query_name)
-                    if run_id is not None:
-                        run_ids.add(run_id)
-                # looks like RG.IDs have collided without merging (CW-4608)
-                if any(len(rgids) > 1 for rgids in runid_model_to_rgid.values()):
-                    raise ValueError(
-                        "BAM appears to have multiple RG.IDs corresponding to "
-                        "the same sequencing run in the same file. Suspect that "
-                        "this BAM was created with samtools merge without -c."
-                    )
+    # the files are independent of each other and can be scanned in parallel
+    n_workers = min(len(target_files), AVAILABLE_CPUS)
+    if n_workers > 1:
+        file_metas = list(get_scan_executor(n_workers).map(
+            scan_file,
+            target_files,
+            repeat(input_type),
+            repeat(collect_names),
+        ))
+    else:
+        file_metas = [
+            scan_file(file, input_type, collect_names, XAM_THREADS)
+            for file in target_files
+        ]
+    for file, file_meta in zip(target_files, file_metas):
+        n_seqs += file_meta["n_seqs"]
+        run_ids.update(file_meta["run_ids"])
+        basecall_models.update(file_meta["basecall_models"])
+        if input_type == "bam":
+            n_primary += file_meta["n_primary"]
+            n_unmapped += file_meta["n_unmapped"]
+            sq_lines = file_meta["sq_lines"]
+            if sq_cache is not None:
+                sq_cache[Path(file).resolve()] = sq_lines
+            # Check if the data are aligned
+            if sq_lines and not file_meta["xam_sorted"]:
+                src_xam = None
+                src_xai = None
     # add n_reads, run_ids, etc to the dict to be checked later
     prel_meta = dict(
-        names=names,
         run_ids=run_ids,
         basecall_models=list(basecall_models)
     )
+    if collect_names:
+        # the per-file lists are already complete, so there is no need to copy them
+        # when there is only a single file
+        if len(file_metas) == 1:
+            prel_meta["names"] = file_metas[0]["names"]
+        else:
+            prel_meta["names"] = list(
+                chain.from_iterable(file_meta["names"] for file_meta in file_metas)
+            )
     if output_type == "fastq":
-        prel_meta["n_seqs"] = len(names)
+        prel_meta["n_seqs"] = n_seqs
     else:
         prel_meta["n_primary"] = n_primary
         prel_meta["n_unmapped"] = n_unmapped
@@ -221,35 +507,38 @@ def create_metadict(**kwargs):
     defaults = dict(barcode=None, type="test_sample", run_ids=[], basecall_models=[])
     if "run_ids" in kwargs:
         # cast to sorted list to compare to workflow output
-        kwargs["run_ids"] = sorted(list(kwargs["run_ids"]))
+        kwargs["run_ids"] = sorted(kwargs["run_ids"])
     defaults.update(kwargs)
     defaults["alias"] = defaults["alias"].replace(" ", "_")
     return defaults
 
 
-def is_unaligned(path):
+def is_unaligned(path, sq_cache=None, target_files=None):
     """Check if uBAM.
 
     When a single file, checks if there are `@SQ` lines in the header. When a directory,
     return `True` if all XAM files are missing `@SQ` lines. If there are mixed headers
     (i.e. some have `@SQ` lines and some don't or the `@SQ` lines between different
-    files don't match), blow up.
+    files don't match), blow up. If `sq_cache` (as populated by
+    `create_preliminary_meta()`) is provided, headers of files in it are not re-read.
+    If `target_files` is provided for a directory, it is used instead of listing the
+    directory again.
     """
-    if path.is_file():
-        target_files = [path]
-    elif path.is_dir():
-        target_files = get_target_files(path, "bam")
-    else:
-        raise ValueError("`path` is neither file nor directory.")
+    if target_files is None:
+        if path.is_file():
+            target_files = [path]
+        elif path.is_dir():
+            target_files = get_target_files(path, "bam")
+        else:
+            raise ValueError("`path` is neither file nor directory.")
 
     first_sq_lines = None
     for target_file in target_files:
-        with pysam.AlignmentFile(target_file, check_sq=False) as f:
-            sq_lines = [{
-                "SN": sq["SN"],
-                "LN": sq["LN"],
-                "M5": sq.get("M5"),
-            } for sq in f.header.get("SQ", [])]
+        cache_key = target_file.resolve()
+        if sq_cache is not None and cache_key in sq_cache:
+            sq_lines = sq_cache[cache_key]
+        else:
+            sq_lines = read_sq_lines(target_file)
         if first_sq_lines is None:
             # first file
             first_sq_lines = sq_lines
@@ -269,6 +558,17 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
     input_path = Path(input_path)
     # find the valid inputs
     valid_inputs = []
+    # `@SQ` lines of XAM files seen while creating the preliminary meta; this avoids
+    # parsing the headers again in `is_unaligned()` below
+    sq_cache = {}
+    # target files per directory; several of the checks below look at the same
+    # directories
+    target_files_cache = {}
+
+    def get_cached_target_files(path):
+        if path not in target_files_cache:
+            target_files_cache[path] = get_target_files(path, input_type)
+        return target_files_cache[path]
 
     # handle file case first
     if input_path.is_file():
@@ -277,8 +577,8 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
             input_path,
             input_type,
             output_type,
+            sq_cache=sq_cache,
         )
-        del prel_meta['names']
         meta = create_metadict(
             alias=params["sample"]
             if params["sample"] is not None
@@ -288,11 +588,11 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
         valid_inputs.append([meta, input_path])
     else:
         # is a directory --> check if target files in top-level dir or in sub-dirs
-        top_dir_target_files = get_target_files(input_path, input_type)
+        top_dir_target_files = get_cached_target_files(input_path)
         subdirs_with_target_files = [
             x
             for x in input_path.iterdir()
-            if x.is_dir() and get_target_files(x, input_type)
+            if x.is_dir() and get_cached_target_files(x)
         ]
         if top_dir_target_files and subdirs_with_target_files:
             raise ValueError(
@@ -312,9 +612,8 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
                 top_dir_target_files,
                 input_type,
                 output_type,
+                sq_cache=sq_cache,
             )
-
-            del prel_meta['names']
             meta = create_metadict(
                 alias=params["sample"]
                 if params["sample"] is not None
@@ -327,7 +626,7 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
             for subdir in subdirs_with_target_files:
                 # make sure we don't have sub-sub-directories containing target files
                 if any(
-                    get_target_files(x, input_type)
+                    get_cached_target_files(x)
                     for x in subdir.iterdir()
                     if x.is_dir()
                 ):
@@ -340,11 +639,11 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
                     continue
                 # get the run IDs of all files
                 prel_meta = create_preliminary_meta(
-                    subdir,
+                    get_cached_target_files(subdir),
                     input_type,
                     output_type,
+                    sq_cache=sq_cache,
                 )
-                del prel_meta['names']
                 barcode = subdir.name
                 meta = create_metadict(
                     alias=barcode,
@@ -354,20 +653,21 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
                 valid_inputs.append([meta, subdir])
             # parse the sample sheet in case there was one
             if sample_sheet is not None:
-                sample_sheet = pd.read_csv(sample_sheet).set_index(
-                    # set 'barcode' as index while also keeping the 'barcode' column in
-                    # the df
-                    "barcode",
-                    drop=False,
-                )
+                # use the `-sig` codec to drop a UTF-8 BOM (like `pandas` and
+                # `check_sample_sheet.py` do)
+                with open(sample_sheet, newline="", encoding="utf-8-sig") as f:
+                    sample_sheet_rows = list(csv.DictReader(f))
                 # ingress uses `groupKey` for the 'analysis_group' column in the sample
                 # sheet
-                if "analysis_group" in sample_sheet.columns:
-                    analysis_group_counts = sample_sheet.value_counts("analysis_group")
-                    sample_sheet["analysis_group"] = [
-                        {"groupSize": analysis_group_counts[grp], "groupTarget": grp}
-                        for grp in sample_sheet["analysis_group"]
-                    ]
+                if sample_sheet_rows and "analysis_group" in sample_sheet_rows[0]:
+                    analysis_group_counts = Counter(
+                        row["analysis_group"] for row in sample_sheet_rows
+                    )
+                    for row in sample_sheet_rows:
+                        grp = row["analysis_group"]
+                        row["analysis_group"] = {
+                            "groupSize": analysis_group_counts[grp], "groupTarget": grp
+                        }
                 # now, get the corresponding inputs for each entry in the sample sheet
                 # (sample sheet entries for which no input directory was found will have
                 # `None` as their input path in `valid_inputs`); we need a dict mapping
@@ -377,13 +677,16 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
                 }
                 # reset `valid_inputs`
                 valid_inputs = []
-                for barcode, sample_sheet_entry in sample_sheet.iterrows():
+                for sample_sheet_entry in sample_sheet_rows:
+                    # look up the barcode outside the `try` so that a sample sheet
+                    # without 'barcode' column blows up
+                    barcode = sample_sheet_entry["barcode"]
                     try:
                         meta, path = valid_inputs_dict[barcode]
                     except KeyError:
                         meta, path = {}, None
-                    meta.update(dict(sample_sheet_entry))
-                    valid_inputs.append([create_metadict(**dict(meta)), path])
+                    meta.update(sample_sheet_entry)
+                    valid_inputs.append([create_metadict(**meta), path])
     # Finally, in case of XAM, loop over the valid inputs again and check if
     # they are uBAM. If so and not `keep_unaligned`, set the path to `None` and
     # the run IDs to `[]`.
@@ -391,7 +694,12 @@ def get_valid_inputs(input_path, input_type, output_type, sample_sheet, params):
         valid_inputs_tmp = []
         for meta, path in valid_inputs:
             if path is not None:
-                meta["is_unaligned"] = is_unaligned(path)
+                meta["is_unaligned"] = is_unaligned(
+                    path,
+                    sq_cache=sq_cache,
+                    # `None` for single-file inputs
+                    target_files=target_files_cache.get(path),
+                )
                 if meta.get("is_unaligned") and not params["wf"]["keep_unaligned"]:
                     path = None
                     meta["run_ids"] = []